@@ -1,3 +1,6 @@
+from collections import defaultdict
+
+import torch
 from torch.optim.optimizer import Optimizer
 
 from ignite.engine import Engine, Events
@@ -22,8 +25,32 @@ class MetricsHandler(BaseHandler):
     ):
         global_step = self.global_step_fn()
 
-        for name, value in engine.state.metrics.items():
-            logger.writer.add_scalar(f"{self.tag}/{name}", value.item(), global_step)
+        # Not using `add_scalars` because it writes every metric to a separate run,
+        # which would change the tags used by the custom scalars layout
+        for name, value in _metrics_to_python(engine.state.metrics).items():
+            logger.writer.add_scalar(f"{self.tag}/{name}", value, global_step)
+
+
+def _metrics_to_python(metrics: dict) -> dict:
+    """Convert metrics to python numbers.
+
+    Metrics can be python numbers or 0-d tensors that might still be on the GPU,
+    tensors are stacked and transferred to the host once per device.
+    """
+    result = dict(metrics)
+
+    names_by_device = defaultdict(list)
+    for name, value in metrics.items():
+        if isinstance(value, torch.Tensor):
+            names_by_device[value.device].append(name)
+
+    for names in names_by_device.values():
+        values = torch.stack(
+            [metrics[name].detach().float().reshape(()) for name in names]
+        ).tolist()
+        result.update(zip(names, values))
+
+    return result
 
 
 class OptimizerParamsHandler(_OptimizerParamsHandler):
@@ -1,7 +1,5 @@
 from typing import List
 
-import numpy as np
-import sklearn.metrics
 import torch
 from ignite.engine import Engine
 from ignite.metrics import Metric
@@ -20,44 +18,128 @@ def mean_average_precision(annotations, scores) -> float:
     # The correct behavior (for each class compute the AP using all samples, then average across classes)
     # corresponds to the `macro` aggregation from scikit-learn.
     # However, if we are given a small batch it is possible to have a column of all 0s in the annotations matrix,
-    # i.e. none of the samples is positive for that class. It's best to pass `average=None` so that per-class
-    # APs are returned and then compute the mean manually skipping nan values.
+    # i.e. none of the samples is positive for that class. Per-class APs are NaN for such classes,
+    # so the mean is computed manually skipping nan values.
+    return _mean_average_precision(
+        torch.as_tensor(annotations), torch.as_tensor(scores)
+    ).item()
 
-    with np.errstate(invalid="ignore"):
-        average_precisions = sklearn.metrics.average_precision_score(
-            y_true=annotations, y_score=scores, average=None
-        )
 
-    if np.isnan(average_precisions).all():
-        return 0
+def _mean_average_precision(annotations, scores) -> torch.Tensor:
+    """Same as :func:`mean_average_precision`, but returns a 0-d tensor
+    that stays on the same device as the inputs."""
+    average_precisions = average_precision_per_class(annotations, scores)
+    finite = torch.isfinite(average_precisions)
+
+    # Mean of the finite values, or 0 if all values are NaN
+    return average_precisions.where(
+        finite, torch.zeros_like(average_precisions)
+    ).sum() / finite.sum().clamp_min(1)
+
 
-    return np.nanmean(average_precisions).item()
+def average_precision_per_class(annotations, scores):
+    """Average precision of each class, computed for all classes at once.
+
+    Equivalent to `sklearn.metrics.average_precision_score(..., average=None)`,
+    tied scores are grouped together and count as a single threshold.
+
+    Args:
+        annotations: tensor of shape [num_samples, num_classes] and values {0, 1}
+        scores: tensor of shape [num_samples, num_classes] and float scores
+
+    Returns:
+        A tensor of shape [num_classes], NaN for classes without positive samples.
+    """
+    # Transpose so that classes are rows: [num_classes, num_samples]
+    annotations = annotations.t()
+    scores = scores.t()
+
+    # tp[c, k] = 1 if the (k+1)-th highest scoring sample for class c is relevant
+    sorted_scores, order = torch.sort(scores, dim=1, descending=True)
+    tp = torch.gather(annotations, index=order, dim=1).float()
+
+    # Samples with the same score form a single threshold, so every rank uses
+    # the precision at the last rank of its tie group, e.g. for the scores
+    # [.9, .5, .5, .5, .1] the last ranks are [0, 3, 3, 3, 4]
+    ranks = torch.arange(tp.shape[1], device=tp.device).expand_as(tp)
+    is_last_of_group = torch.ones_like(tp, dtype=torch.bool)
+    is_last_of_group[:, :-1] = sorted_scores[:, :-1] != sorted_scores[:, 1:]
+    last_of_group = (
+        torch.where(is_last_of_group, ranks, torch.full_like(ranks, tp.shape[1]))
+        .flip(dims=(1,))
+        .cummin(dim=1)
+        .values.flip(dims=(1,))
+    )
+
+    # precision[c, k] = precision of class c at the threshold of the (k+1)-th sample
+    cum_tp = tp.cumsum(dim=1)
+    precision = torch.gather(cum_tp, index=last_of_group, dim=1) / (last_of_group + 1)
+
+    # AP = sum_n (R_n - R_{n-1}) P_n = sum of the precisions at the ranks
+    # of the relevant samples / number of relevant samples
+    num_relevant = tp.sum(dim=1)
+    average_precisions = (precision * tp).sum(dim=1)
+    average_precisions = average_precisions / num_relevant.clamp_min(1)
+    average_precisions[num_relevant == 0] = float("nan")
+
+    return average_precisions
+
+
+def average_precision_per_sample(annotations, scores):
+    """Average precision of each sample, ranking all classes for that sample.
+
+    This is the per-sample AP that :func:`mean_average_precision` should not be confounded with,
+    it's only meant to describe individual samples, e.g. when visualizing predictions.
+
+    Args:
+        annotations: tensor of shape [num_samples, num_classes] and values {0, 1}
+        scores: tensor of shape [num_samples, num_classes] and float scores
+
+    Returns:
+        A tensor of shape [num_samples], NaN for samples without positive classes.
+    """
+    return average_precision_per_class(annotations.t(), scores.t())
 
 
 class PredicateClassificationMeanAveragePrecisionBatch(object):
     def __call__(self, engine: Engine):
         y_true = engine.state.output["target"]
         y_score = engine.state.output["output"]
-        avg_precision = mean_average_precision(y_true, y_score)
+        avg_precision = _mean_average_precision(y_true, y_score)
 
-        # Return tensor so that ignite.metrics.Average takes batch size into account
+        # Return tensor so that ignite.metrics.Average takes batch size into account.
+        # The value stays on the device, it is synchronized with the host when read,
+        # e.g. by the OutputHandler that logs it at every iteration.
         B = len(y_true)
-        avg_precision = torch.full((B, 1), fill_value=avg_precision)
-        engine.state.output[f"pc/mAP"] = avg_precision
+        engine.state.output[f"pc/mAP"] = avg_precision.expand(B, 1)
 
 
 class PredicateClassificationMeanAveragePrecisionEpoch(Metric):
     y_true: List[torch.Tensor]
     y_score: List[torch.Tensor]
+    num_samples: int
 
     def reset(self):
         self.y_true = []
         self.y_score = []
+        self.num_samples = 0
 
     def update(self, output):
         y_true, y_score = output
         self.y_true.append(y_true)
         self.y_score.append(y_score)
+        self.num_samples += len(y_true)
 
     def compute(self):
-        return mean_average_precision(torch.cat(self.y_true), torch.cat(self.y_score))
+        return mean_average_precision(
+            self._concat(self.y_true), self._concat(self.y_score)
+        )
+
+    def _concat(self, tensors: List[torch.Tensor]) -> torch.Tensor:
+        # Concatenate directly into a tensor of the final size,
+        # the number of rows is known from the updates.
+        first = tensors[0]
+        out = torch.empty(
+            (self.num_samples, *first.shape[1:]), dtype=first.dtype, device=first.device
+        )
+        return torch.cat(tensors, dim=0, out=out)
@@ -1,5 +1,7 @@
 import torch
 
+from .recall_at import _num_relevant_at
+
 
 def precision_at(annotations, scores, sizes):
     """Precision@x
@@ -17,32 +19,15 @@ def precision_at(annotations, scores, sizes):
       Precision = ------------------------------ = P ( relevant | retrieved )
                       # ( retrieved items )
     """
-    result = {}
-    # Sorted labels are the indexes that would sort y_score, e.g.
-    # [[ 10, 3, 4, ....., 5, 41 ],
-    #  [  1, 2, 6, ....., 8, 78 ]]
-    # means that for the first image class 10 is the top scoring class
-    sorted_labels = torch.argsort(scores, dim=1, descending=True)
-
-    # One could do this to get the sorted scores
-    # sorted_scores = torch.gather(y_scores, index=sorted_labels, dim=1)
-
-    # Use these indexes to index into y_true, but keep only max(sizes) columns
-    annotations_of_top_max_s = torch.gather(
-        annotations, index=sorted_labels[:, : max(sizes)], dim=1
+    # num_relevant_at_s[i, j] = number of relevant items within the top sizes[j] retrieved items
+    num_relevant_at_s = _num_relevant_at(annotations, scores, sizes)
+
+    # Given a size s, `num_relevant_at_s[i, s] / s` gives the precision for sample i.
+    # Take the batch mean of all sizes at once, so that there is a single
+    # device-to-host transfer for all sizes.
+    divisor = torch.tensor(
+        sizes, dtype=num_relevant_at_s.dtype, device=num_relevant_at_s.device
     )
+    precisions = num_relevant_at_s.mean(dim=0) / divisor
 
-    # cumsum[i, j] = number of relevant items within the top j+1 retrieved items
-    # Cast to float to avoid int/int division.
-    cumsum = annotations_of_top_max_s.cumsum(dim=1).float()
-
-    # Given a size s, `cumsum[i, s-1] / s` gives the precision for sample i.
-    # If we end up doing 0 / 0, it simply means that in the top-s documents
-    # there was no relevant document, so precision should be 0.
-    # Then we take the batch mean.
-    for s in sizes:
-        precision_per_sample = cumsum[:, (s - 1)] / s
-        precision_per_sample[torch.isnan(precision_per_sample)] = 0.0
-        result[s] = precision_per_sample.mean(dim=0).item()
-
-    return result
+    return dict(zip(sizes, precisions.tolist()))
@@ -5,7 +5,7 @@ from ignite.engine import Engine
 from ignite.metrics import Metric
 
 
-def recall_at(annotations, scores, sizes):
+def recall_at(annotations, scores, sizes, aggregate=True):
     """Recall@x
 
     - rank the relationships by their score and keep the top x
@@ -20,6 +20,8 @@ def recall_at(annotations, scores, sizes):
     Args:
         annotations: tensor of shape [num_samples, num_relationships] and values {0, 1}
         scores: tensor of shape [num_samples, num_relationships] and float scores
+        aggregate: if True, the recall is averaged over the samples (skipping samples
+            without relevant items), otherwise the values are tensors of shape [num_samples]
 
     References:
 
@@ -40,38 +42,66 @@ def recall_at(annotations, scores, sizes):
             pairs among the x top scored candidate pairs in each image.
     """
 
-    result = {}
-    # Sorted labels are the indexes that would sort y_score, e.g.
-    # [[ 10, 3, 4, ....., 5, 41 ],
-    #  [  1, 2, 6, ....., 8, 78 ]]
-    # means that for the first image class 10 is the top scoring class
-    sorted_labels = torch.argsort(scores, dim=1, descending=True)
+    num_relevant_at_s = _num_relevant_at(annotations, scores, sizes)
+    if not aggregate:
+        recall_per_sample = _recall_from_num_relevant(
+            annotations, num_relevant_at_s, aggregate=False
+        )
+        return dict(zip(sizes, recall_per_sample.t()))
 
-    # One could do this to get the sorted scores
-    # sorted_scores = torch.gather(y_scores, index=sorted_labels, dim=1)
+    recalls = _recall_from_num_relevant(annotations, num_relevant_at_s)
+    return dict(zip(sizes, recalls.tolist()))
 
-    # Use these indexes to index into y_true, but keep only max(self.sizes) columns
-    annotations_of_top_max_s = torch.gather(
-        annotations, index=sorted_labels[:, : max(sizes)], dim=1
-    )
+
+def _num_relevant_at(annotations, scores, sizes, cols=None, cumsum_out=None):
+    """Number of relevant items among the top-s retrieved, shape [num_samples, len(sizes)]"""
+
+    # With a single size the order within the top-s does not matter,
+    # so a plain sum over the unsorted top-s is enough.
+    if len(sizes) == 1:
+        top_labels = torch.topk(scores, k=sizes[0], dim=1, sorted=False).indices
+        annotations_of_top_s = torch.gather(annotations, index=top_labels, dim=1)
+        return annotations_of_top_s.sum(dim=1, keepdims=True).float()
+
+    # Only the top max(sizes) labels are needed, so there is no need to sort all of them.
+    # Top labels are the indexes of the highest y_score, in descending order, e.g.
+    # [[ 10, 3, 4, ....., 5 ],
+    #  [  1, 2, 6, ....., 8 ]]
+    # means that for the first image class 10 is the top scoring class
+    top_labels = torch.topk(scores, k=max(sizes), dim=1, sorted=True).indices
+
+    # Use these indexes to index into y_true
+    annotations_of_top_max_s = torch.gather(annotations, index=top_labels, dim=1)
 
     # cumsum[i, j] = number of relevant items within the top j+1 retrieved items
     # Cast to float to avoid int/int division later.
-    cumsum = annotations_of_top_max_s.cumsum(dim=1).float()
+    cumsum = torch.cumsum(
+        annotations_of_top_max_s, dim=1, dtype=torch.float, out=cumsum_out
+    )
+
+    # Gather all the requested columns at once
+    if cols is None:
+        cols = torch.tensor([s - 1 for s in sizes], device=cumsum.device)
+    return cumsum.index_select(1, cols)
 
+
+def _recall_from_num_relevant(
+    annotations, num_relevant_at_s, aggregate=True, num_relevant_per_sample=None
+):
     # Divide each row (a sample) by the total number of relevant document for
     # that row, to get the recall per sample.
-    # If for a specific sample there are 0 relevant documents we get NaN in the division.
-    # Last, take the batch mean skipping NaN values.
+    # If for a specific sample there are 0 relevant documents the recall is undefined,
+    # these samples are masked out before taking the batch mean.
     # If we get a batch where all documents have 0 relevant documents, it's a problem.
-    num_relevant_per_sample = annotations.sum(dim=1, keepdims=True)
-    recall_per_sample = cumsum / num_relevant_per_sample
-    for s in sizes:
-        recall_at_s_per_sample = recall_per_sample[:, s - 1]
-        finite = torch.isfinite(recall_at_s_per_sample)
-        result[s] = recall_at_s_per_sample[finite].mean(dim=0).item()
+    if num_relevant_per_sample is None:
+        num_relevant_per_sample = annotations.sum(dim=1, keepdims=True)
+    if not aggregate:
+        # NaN for the samples without relevant documents
+        return num_relevant_at_s / num_relevant_per_sample
 
-    return result
+    valid = num_relevant_per_sample > 0
+    recall_per_sample = num_relevant_at_s / num_relevant_per_sample.clamp_min(1)
+    return (recall_per_sample * valid).sum(dim=0) / valid.sum()
 
 
 class RecallAtBatch(object):
@@ -80,17 +110,54 @@ class RecallAtBatch(object):
     def __init__(self, sizes: Tuple[int, ...] = (10, 30, 50)):
         self._sorted_sizes = list(sorted(sizes))
 
+        # The sizes never change, build the tensor used for indexing once
+        # and keep a copy on every device it is requested on
+        self._cols_cpu = torch.tensor([s - 1 for s in self._sorted_sizes])
+        self._cols = {}
+
+        # Reused across iterations for the intermediate cumsum, grown when needed
+        self._scratch_cumsum = None
+
     def __call__(self, engine: Engine):
         y_true = engine.state.output["target"]
         y_score = engine.state.output["output"]
-        recalls = recall_at(y_true, y_score, self._sorted_sizes)
-
-        # Return tensors so that ignite.metrics.Average takes batch size into account
+        # The cumsum buffer is only used when there are multiple sizes
+        cumsum_out = None
+        if len(self._sorted_sizes) > 1:
+            cumsum_out = self._get_scratch_cumsum(len(y_score), y_score.device)
+        num_relevant_at_s = _num_relevant_at(
+            y_true,
+            y_score,
+            self._sorted_sizes,
+            cols=self._get_cols(y_score.device),
+            cumsum_out=cumsum_out,
+        )
+        recalls = _recall_from_num_relevant(y_true, num_relevant_at_s)
+
+        # Return tensors so that ignite.metrics.Average takes batch size into account.
+        # The values stay on the device, they are synchronized with the host when read,
+        # e.g. by the OutputHandler that logs them at every iteration.
         B = len(y_true)
         engine.state.output["recalls"] = {}
-        for k, r in recalls.items():
-            r = torch.full((B, 1), fill_value=r)
-            engine.state.output["recalls"][f"pc/recall_at_{k}"] = r
+        for k, r in zip(self._sorted_sizes, recalls):
+            engine.state.output["recalls"][f"pc/recall_at_{k}"] = r.expand(B, 1)
+
+    def _get_cols(self, device: torch.device):
+        if device not in self._cols:
+            self._cols[device] = self._cols_cpu.to(device)
+        return self._cols[device]
+
+    def _get_scratch_cumsum(self, num_samples: int, device: torch.device):
+        if (
+            self._scratch_cumsum is None
+            or self._scratch_cumsum.device != device
+            or len(self._scratch_cumsum) < num_samples
+        ):
+            self._scratch_cumsum = torch.empty(
+                (num_samples, self._sorted_sizes[-1]), dtype=torch.float, device=device
+            )
+        # Slicing the first dimension keeps the buffer contiguous
+        return self._scratch_cumsum[:num_samples]
 
 
 class RecallAtEpoch(Metric):
@@ -98,6 +165,7 @@ class RecallAtEpoch(Metric):
 
     _y_true: List[torch.Tensor]
     _y_score: List[torch.Tensor]
+    _num_relevant: List[torch.Tensor]
 
     def __init__(
         self,
@@ -111,18 +179,29 @@ class RecallAtEpoch(Metric):
     def reset(self):
         self._y_true = []
         self._y_score = []
+        self._num_relevant = []
 
     def update(self, output: Tuple[torch.Tensor, torch.Tensor]):
         y_true, y_score = output
         self._y_true.append(y_true)
         self._y_score.append(y_score)
+        # Sum per batch, so compute() doesn't have to go over the whole epoch again
+        self._num_relevant.append(y_true.sum(dim=1, keepdims=True))
 
     def compute(self):
-        y_true = torch.cat(self._y_true, dim=0)
-        y_score = torch.cat(self._y_score, dim=0)
-        return recall_at(y_true, y_score, self._sorted_sizes)
+        return dict(zip(self._sorted_sizes, self._compute_recalls().tolist()))
 
     def completed(self, engine, name):
-        result = self.compute()
-        for k, v in result.items():
+        # Store 0-d tensors, they are converted to python numbers when read by the loggers
+        recalls = self._compute_recalls()
+        for k, v in zip(self._sorted_sizes, recalls):
             engine.state.metrics[f"{name}_{k}"] = v
+
+    def _compute_recalls(self):
+        y_true = torch.cat(self._y_true, dim=0)
+        y_score = torch.cat(self._y_score, dim=0)
+        num_relevant = torch.cat(self._num_relevant, dim=0)
+        num_relevant_at_s = _num_relevant_at(y_true, y_score, self._sorted_sizes)
+        return _recall_from_num_relevant(
+            y_true, num_relevant_at_s, num_relevant_per_sample=num_relevant
+        )
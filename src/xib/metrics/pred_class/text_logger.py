@@ -1,5 +1,6 @@
+import functools
 from pathlib import Path
-from typing import Tuple, Callable, Optional, Union, Iterator
+from typing import Tuple, Callable, Optional, Union, Sequence
 
 import numpy as np
 import torch
@@ -8,11 +9,72 @@ from detectron2.data.catalog import Metadata
 from ignite.engine import Engine
 from tensorboardX import SummaryWriter
 
-from .mean_avg_prec import mean_average_precision
+from .mean_avg_prec import average_precision_per_sample
 from .recall_at import recall_at
 from xib.structures import Vocabulary, ImageSize
 
 
+@functools.lru_cache(maxsize=256)
+def _load_rgb(path: str) -> np.ndarray:
+    """Load an image in RGB at half resolution, which is enough for the logged tiles.
+
+    The same images are logged over and over again, e.g. at every validation epoch,
+    so the decoded images are cached. They are made read-only since they are shared.
+    """
+    import cv2
+
+    # Some images are black and white, make sure they are read as RBG
+    image = cv2.imread(path, cv2.IMREAD_REDUCED_COLOR_2)
+    if image is None:
+        raise FileNotFoundError(f"Could not read image: {path}")
+    image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+    image.setflags(write=False)
+    return image
+
+
+_TITLE_HEIGHT = 24
+_FONT_SCALE = 0.45
+_LINE_HEIGHT = 16
+
+
+def _draw_text(
+    canvas: np.ndarray,
+    lines: Sequence[str],
+    top_left: Tuple[int, int],
+    background: bool = True,
+):
+    """Draw lines of text on the canvas, optionally on top of a white box.
+
+    Text and box are clipped at the border of the canvas.
+    """
+    import cv2
+
+    if len(lines) == 0:
+        return
+
+    x, y = top_left
+    if background:
+        width = max(
+            cv2.getTextSize(line, cv2.FONT_HERSHEY_SIMPLEX, _FONT_SCALE, 1)[0][0]
+            for line in lines
+        )
+        box = canvas[y : y + _LINE_HEIGHT * len(lines) + 4, x : x + width + 4]
+        # Blend a white box with the image, similar to a semi-transparent background
+        box[...] = (0.2 * box + 0.8 * 255).astype(np.uint8)
+
+    for i, line in enumerate(lines):
+        cv2.putText(
+            canvas,
+            line,
+            (x + 2, y + (i + 1) * _LINE_HEIGHT - 2),
+            cv2.FONT_HERSHEY_SIMPLEX,
+            _FONT_SCALE,
+            color=(0, 0, 0),
+            thickness=1,
+            lineType=cv2.LINE_AA,
+        )
+
+
 class PredicateClassificationLogger(object):
     def __init__(
         self,
@@ -22,6 +84,7 @@ class PredicateClassificationLogger(object):
         global_step_fn: Callable[[], int],
         metadata: Metadata,
         save_dir: Optional[Union[str, Path]] = None,
+        tile_size: Tuple[int, int] = (300, 400),
     ):
         """
 
@@ -32,9 +95,11 @@ class PredicateClassificationLogger(object):
             logger: tensorboard logger for the images
             global_step_fn:
             save_dir: optional destination for .jpg images
+            tile_size: (height, width) in pixels of each image in the grid
         """
         self.tag = tag
         self.grid = grid
+        self.tile_size = tile_size
         self.logger = logger
         self.global_step_fn = global_step_fn
         self.predicate_vocabulary = Vocabulary(metadata.predicate_classes)
@@ -49,103 +114,97 @@ class PredicateClassificationLogger(object):
             self.save_dir.mkdir(parents=True, exist_ok=True)
 
     def __call__(self, engine: Engine):
-        import matplotlib.pyplot as plt
-
-        plt.switch_backend("Agg")
+        import cv2
 
         global_step = self.global_step_fn()
 
-        predicate_probs = engine.state.output["output"].sigmoid()
+        # Sigmoid is monotonic, so ranking metrics and top-5 can use the logits directly,
+        # only the scores that are displayed are converted to probabilities
+        predicate_logits = engine.state.output["output"]
         targets_bce = engine.state.output["target"]
         filenames = engine.state.batch[2]
 
-        fig, axes = plt.subplots(*self.grid, figsize=(16, 12), dpi=50)
-        axes_iter: Iterator[plt.Axes] = axes.flat
-
-        for target, pred, filename, ax in zip(
-            targets_bce, predicate_probs, filenames, axes_iter
+        # All images are drawn on a single canvas with a grid of tiles,
+        # each tile has a title bar followed by the image.
+        # Tiles are drawn separately, so that text never overflows into the next tile.
+        tile_h, tile_w = self.tile_size
+        canvas = np.full(
+            (tile_h * self.grid[0], tile_w * self.grid[1], 3), 255, dtype=np.uint8
+        )
+        tile_corners = [
+            (row * tile_h, col * tile_w)
+            for row in range(self.grid[0])
+            for col in range(self.grid[1])
+        ]
+
+        # Compute the metrics of all samples at once
+        recalls = recall_at(targets_bce, predicate_logits, (5,), aggregate=False)
+        recalls_at_5 = recalls[5].tolist()
+        average_precisions = average_precision_per_sample(
+            targets_bce, predicate_logits
+        ).tolist()
+
+        for target, pred, filename, (y, x), recall_at_5, avg_prec in zip(
+            targets_bce,
+            predicate_logits,
+            filenames,
+            tile_corners,
+            recalls_at_5,
+            average_precisions,
         ):
-            # Some images are black and white, make sure they are read as RBG
-            image = Image.open(self.img_dir.joinpath(filename)).convert("RGB")
-            img_size = ImageSize(image.size[1], image.size[0])
-            image = np.asarray(image)
+            image = _load_rgb(self.img_dir.joinpath(filename).as_posix())
 
-            recall_at_5 = recall_at(target[None, :], pred[None, :], (5,))[5]
-            mAP = mean_average_precision(target[None, :], pred[None, :])
-
-            ax.imshow(image)
-            ax.set_title(
-                f"{Path(filename).name[:-4]} mAP {mAP:.1%} R@5 {recall_at_5:.1%}"
+            # Resize the image to fit below the title, keeping the aspect ratio
+            img_size = ImageSize(*image.shape[:2])
+            scale = min(
+                (tile_h - _TITLE_HEIGHT) / img_size.height, tile_w / img_size.width
+            )
+            resized_size = ImageSize(
+                int(img_size.height * scale), int(img_size.width * scale)
+            )
+            image = cv2.resize(
+                image,
+                (resized_size.width, resized_size.height),
+                interpolation=cv2.INTER_AREA,
+            )
+            tile = np.full((tile_h, tile_w, 3), 255, dtype=np.uint8)
+            img_y = _TITLE_HEIGHT
+            img_x = (tile_w - resized_size.width) // 2
+            tile[
+                img_y : img_y + resized_size.height, img_x : img_x + resized_size.width
+            ] = image
+
+            _draw_text(
+                tile,
+                [f"{Path(filename).name[:-4]} AP {avg_prec:.1%} R@5 {recall_at_5:.1%}"],
+                (4, 4),
+                background=False,
             )
 
             target_str = self.predicate_vocabulary.get_str(
                 target.nonzero().flatten()
             ).tolist()
-            ax.text(
-                0.05,
-                0.95,
-                "\n".join(target_str),
-                transform=ax.transAxes,
-                fontsize=11,
-                verticalalignment="top",
-                bbox=dict(boxstyle="square", facecolor="white", alpha=0.8),
-            )
+            _draw_text(tile, target_str, (img_x + 4, img_y + 4))
 
-            top_5 = torch.argsort(pred, descending=True)[:5]
+            top_5_logits, top_5 = torch.topk(pred, k=5)
             prediction_str = [
                 f"{score:.1%} {str}"
                 for score, str in zip(
-                    pred[top_5], self.predicate_vocabulary.get_str(top_5)
+                    top_5_logits.sigmoid().tolist(),
+                    self.predicate_vocabulary.get_str(top_5),
                 )
             ]
-            ax.text(
-                0.65,
-                0.95,
-                "\n".join(prediction_str),
-                transform=ax.transAxes,
-                fontsize=11,
-                verticalalignment="top",
-                bbox=dict(boxstyle="square", facecolor="white", alpha=0.8),
-            )
-
-            ax.tick_params(
-                which="both",
-                **{
-                    k: False
-                    for k in (
-                        "bottom",
-                        "top",
-                        "left",
-                        "right",
-                        "labelbottom",
-                        "labeltop",
-                        "labelleft",
-                        "labelright",
-                    )
-                },
+            _draw_text(
+                tile,
+                prediction_str,
+                (img_x + int(0.6 * resized_size.width), img_y + 4),
             )
-            ax.set_xlim(0, img_size.width)
-            ax.set_ylim(img_size.height, 0)
 
-        fig.tight_layout()
+            canvas[y : y + tile_h, x : x + tile_w] = tile
 
         if self.save_dir is not None:
-            import io
-
-            with io.BytesIO() as buff:
-                fig.savefig(
-                    buff, format="png", facecolor="white", bbox_inches="tight", dpi=50
-                )
-                pil_img = Image.open(buff).convert("RGB")
-                plt.close(fig)
             save_path = self.save_dir.joinpath(f"{global_step}.{self.tag}.jpg")
-            pil_img.save(save_path, "JPEG")
-            self.logger.add_image(
-                f"{self.tag}",
-                np.moveaxis(np.asarray(pil_img), 2, 0),
-                global_step=global_step,
-            )
-        else:
-            self.logger.add_figure(
-                f"{self.tag}", fig, global_step=global_step, close=True
-            )
+            Image.fromarray(canvas).save(save_path, "JPEG")
+        self.logger.add_image(
+            f"{self.tag}", np.moveaxis(canvas, 2, 0), global_step=global_step
+        )
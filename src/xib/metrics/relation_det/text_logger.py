@@ -72,75 +72,111 @@ class VisualRelationPredictionLogger(object):
         # import matplotlib.pyplot as plt
         # plt.switch_backend('Agg')
 
-        text = ""
+        text = []
 
+        # Transfer every attribute of the batch to numpy once, as one array per attribute,
+        # then split it per graph. The loops below only deal with python values.
+        pred_n_nodes = relations.n_nodes.tolist()
+        pred_n_edges = relations.n_edges.tolist()
         pred_node_offsets = [0] + relations.n_nodes[:-1].cumsum(dim=0).tolist()
-        pred_relation_scores = torch.split_with_sizes(
-            relations.relation_scores, relations.n_edges.tolist()
+        pred_edge_splits = np.cumsum(pred_n_edges[:-1])
+        pred_object_classes = relations.object_classes.cpu().numpy()
+        pred_object_boxes = relations.object_boxes.cpu().int().numpy()
+        pred_relation_scores = np.split(
+            relations.relation_scores.cpu().numpy(), pred_edge_splits
         )
-        pred_predicate_scores = torch.split_with_sizes(
-            relations.predicate_scores, relations.n_edges.tolist()
+        pred_predicate_scores = np.split(
+            relations.predicate_scores.cpu().numpy(), pred_edge_splits
         )
-        pred_predicate_classes = torch.split_with_sizes(
-            relations.predicate_classes, relations.n_edges.tolist()
+        pred_predicate_classes = np.split(
+            relations.predicate_classes.cpu().numpy(), pred_edge_splits
         )
-        pred_relation_indexes = torch.split_with_sizes(
-            relations.relation_indexes, relations.n_edges.tolist(), dim=1
+        pred_relation_indexes = np.split(
+            relations.relation_indexes.cpu().numpy(), pred_edge_splits, axis=1
         )
 
+        gt_n_edges = targets.n_edges.tolist()
         gt_node_offsets = [0] + targets.n_nodes[:-1].cumsum(dim=0).tolist()
-        gt_predicate_classes = torch.split_with_sizes(
-            targets.predicate_classes, targets.n_edges.tolist()
+        gt_edge_splits = np.cumsum(gt_n_edges[:-1])
+        gt_object_classes = targets.object_classes.cpu().numpy()
+        gt_object_boxes = targets.object_boxes.cpu().int().numpy()
+        gt_predicate_classes = np.split(
+            targets.predicate_classes.cpu().numpy(), gt_edge_splits
         )
-        gt_relation_indexes = torch.split_with_sizes(
-            targets.relation_indexes, targets.n_edges.tolist(), dim=1
+        gt_relation_indexes = np.split(
+            targets.relation_indexes.cpu().numpy(), gt_edge_splits, axis=1
         )
 
+        # A relation (subj_class, subj_idx, predicate_class, obj_idx, obj_class)
+        # is packed into a single int to make the retrieved check cheaper,
+        # each field gets enough bits to represent all its possible values.
+        object_bits = len(self.object_vocabulary).bit_length()
+        predicate_bits = len(self.predicate_vocabulary).bit_length()
+        node_bits = max(len(pred_object_boxes), len(gt_object_boxes)).bit_length()
+        obj_idx_shift = object_bits
+        predicate_shift = obj_idx_shift + node_bits
+        subj_class_shift = predicate_shift + predicate_bits
+        subj_idx_shift = subj_class_shift + object_bits
+
         for b in range(min(relations.num_graphs, self.grid[0] * self.grid[1])):
-            buffer = (
+            # Rows are collected in a list and joined once at the end
+            buffer = [
                 f"{filenames[b]}\n"
-                f"- input instances {relations.n_nodes[b].item()}\n"
-                f"- (subj, obj) pairs {(relations.n_nodes[b] * (relations.n_nodes[b] - 1)).item()}\n\n"
-            )
+                f"- input instances {pred_n_nodes[b]}\n"
+                f"- (subj, obj) pairs {pred_n_nodes[b] * (pred_n_nodes[b] - 1)}\n\n"
+            ]
 
             top_x_relations = set()
             count_retrieved = 0
-            buffer += f"Top {relations.n_edges[b].item()} predicted relations:\n"
-            for i in range(relations.n_edges[b].item()):
-                node_offset = pred_node_offsets[b]
-                score = pred_relation_scores[b][i].item()
-
-                subj_idx = pred_relation_indexes[b][0, i].item()
-                obj_idx = pred_relation_indexes[b][1, i].item()
-                predicate_score = pred_predicate_scores[b][i].item()
-                predicate_class = pred_predicate_classes[b][i].item()
-                predicate_str = self.predicate_vocabulary.get_str(predicate_class)
-
-                subj_class = relations.object_classes[
-                    pred_relation_indexes[b][0, i]
-                ].item()
-                obj_class = relations.object_classes[
-                    pred_relation_indexes[b][1, i]
-                ].item()
-                subj_box = (
-                    relations.object_boxes[pred_relation_indexes[b][0, i]]
-                    .cpu()
-                    .int()
-                    .numpy()
-                )
-                obj_box = (
-                    relations.object_boxes[pred_relation_indexes[b][1, i]]
-                    .cpu()
-                    .int()
-                    .numpy()
+            buffer.append(f"Top {pred_n_edges[b]} predicted relations:\n")
+
+            # Look up the vocabulary for all edges together
+            node_offset = pred_node_offsets[b]
+            subj_idxs, obj_idxs = pred_relation_indexes[b]
+            subj_classes = pred_object_classes[subj_idxs]
+            obj_classes = pred_object_classes[obj_idxs]
+            predicate_strs = self.predicate_vocabulary.get_str(
+                pred_predicate_classes[b]
+            ).tolist()
+            subj_strs = self.object_vocabulary.get_str(subj_classes).tolist()
+            obj_strs = self.object_vocabulary.get_str(obj_classes).tolist()
+
+            for i, (
+                score,
+                subj_idx,
+                obj_idx,
+                predicate_score,
+                predicate_class,
+                subj_class,
+                obj_class,
+                predicate_str,
+                subj_str,
+                obj_str,
+            ) in enumerate(
+                zip(
+                    pred_relation_scores[b].tolist(),
+                    subj_idxs.tolist(),
+                    obj_idxs.tolist(),
+                    pred_predicate_scores[b].tolist(),
+                    pred_predicate_classes[b].tolist(),
+                    subj_classes.tolist(),
+                    obj_classes.tolist(),
+                    predicate_strs,
+                    subj_strs,
+                    obj_strs,
                 )
-                subj_str = self.object_vocabulary.get_str(subj_class)
-                obj_str = self.object_vocabulary.get_str(obj_class)
+            ):
+                subj_box = pred_object_boxes[subj_idx]
+                obj_box = pred_object_boxes[obj_idx]
 
                 top_x_relations.add(
-                    (subj_class, subj_idx, predicate_class, obj_idx, obj_class)
+                    (subj_idx << subj_idx_shift)
+                    | (subj_class << subj_class_shift)
+                    | (predicate_class << predicate_shift)
+                    | (obj_idx << obj_idx_shift)
+                    | obj_class
                 )
-                buffer += (
+                buffer.append(
                     f"{i + 1:3d} {score:.1e} : "
                     f"({subj_idx - node_offset:3d}) {subj_str:<14} "
                     f"{predicate_str:^14} "
@@ -148,44 +184,51 @@ class VisualRelationPredictionLogger(object):
                     f"{str(subj_box):<25} {predicate_score:>6.1%} {str(obj_box):>25}\n"
                 )
 
-            buffer += f"\nGround-truth relations:\n"
-            for j in range(targets.n_edges[b].item()):
-                node_offset = gt_node_offsets[b]
-
-                subj_idx = gt_relation_indexes[b][0, j].item()
-                obj_idx = gt_relation_indexes[b][1, j].item()
-                predicate_class = gt_predicate_classes[b][j].item()
-                predicate_str = self.predicate_vocabulary.get_str(predicate_class)
-
-                subj_class = targets.object_classes[gt_relation_indexes[b][0, j]].item()
-                obj_class = targets.object_classes[gt_relation_indexes[b][1, j]].item()
-                subj_box = (
-                    targets.object_boxes[gt_relation_indexes[b][0, j]]
-                    .cpu()
-                    .int()
-                    .numpy()
-                )
-                obj_box = (
-                    targets.object_boxes[gt_relation_indexes[b][1, j]]
-                    .cpu()
-                    .int()
-                    .numpy()
-                )
-                subj_str = self.object_vocabulary.get_str(subj_class)
-                obj_str = self.object_vocabulary.get_str(obj_class)
+            buffer.append(f"\nGround-truth relations:\n")
+            node_offset = gt_node_offsets[b]
+            subj_idxs, obj_idxs = gt_relation_indexes[b]
+            subj_classes = gt_object_classes[subj_idxs]
+            obj_classes = gt_object_classes[obj_idxs]
+            predicate_strs = self.predicate_vocabulary.get_str(
+                gt_predicate_classes[b]
+            ).tolist()
+            subj_strs = self.object_vocabulary.get_str(subj_classes).tolist()
+            obj_strs = self.object_vocabulary.get_str(obj_classes).tolist()
+
+            for (
+                subj_idx,
+                obj_idx,
+                predicate_class,
+                subj_class,
+                obj_class,
+                predicate_str,
+                subj_str,
+                obj_str,
+            ) in zip(
+                subj_idxs.tolist(),
+                obj_idxs.tolist(),
+                gt_predicate_classes[b].tolist(),
+                subj_classes.tolist(),
+                obj_classes.tolist(),
+                predicate_strs,
+                subj_strs,
+                obj_strs,
+            ):
+                subj_box = gt_object_boxes[subj_idx]
+                obj_box = gt_object_boxes[obj_idx]
 
                 # Assume the input boxes are from GT, not detectron, otherwise we'd have to match by IoU
                 # TODO add matching by IoU
                 retrieved = (
-                    subj_class,
-                    subj_idx,
-                    predicate_class,
-                    obj_idx,
-                    obj_class,
+                    (subj_idx << subj_idx_shift)
+                    | (subj_class << subj_class_shift)
+                    | (predicate_class << predicate_shift)
+                    | (obj_idx << obj_idx_shift)
+                    | obj_class
                 ) in top_x_relations
                 if retrieved:
                     count_retrieved += 1
-                buffer += (
+                buffer.append(
                     f'{"  OK️" if retrieved else "    "}        : '
                     f"({subj_idx - node_offset:3d}) {subj_str:<14} "
                     f"{predicate_str:^14} "
@@ -193,12 +236,15 @@ class VisualRelationPredictionLogger(object):
                     f"{str(subj_box):<25}        {str(obj_box):>25}\n"
                 )
 
-            buffer += f"\nRecall@{self.top_x_relations}: {count_retrieved / targets.n_edges[b].item():.2%}\n\n"
+            buffer.append(
+                f"\nRecall@{self.top_x_relations}: {count_retrieved / gt_n_edges[b]:.2%}\n\n"
+            )
 
-            text += textwrap.indent(buffer, "    ", lambda line: True) + "---\n\n"
+            text.append(textwrap.indent("".join(buffer), "    ", lambda line: True))
+            text.append("---\n\n")
 
         self.logger.add_text(
-            f"Visual relations ({self.tag})", text, global_step=global_step
+            f"Visual relations ({self.tag})", "".join(text), global_step=global_step
         )
 
         # fig, axes = plt.subplots(*self.grid, figsize=(16, 12), dpi=50)
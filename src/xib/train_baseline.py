@@ -395,8 +395,8 @@ def main():
             "train",
             output_transform=lambda o: {
                 **o["losses"],
-                "pc/mAP": o["pc/mAP"].mean().item(),
-                **{k: r.mean().item() for k, r in o["recalls"].items()},
+                "pc/mAP": o["pc/mAP"].mean(),
+                **{k: r.mean() for k, r in o["recalls"].items()},
             },
             global_step_transform=pred_class_trainer.global_step,
         ),
@@ -502,9 +502,9 @@ def main():
             DiskSaver(
                 Path(conf.checkpoint.folder).expanduser().resolve() / conf.fullname
             ),
-            score_function=lambda val_engine: val_engine.state.metrics[
-                "pc/recall_at_5"
-            ],
+            score_function=lambda val_engine: float(
+                val_engine.state.metrics["pc/recall_at_5"]
+            ),
             score_name="pc_recall_at_5",
             n_saved=conf.checkpoint.keep,
             global_step_transform=pred_class_trainer.global_step,
@@ -0,0 +1,75 @@
+import numpy as np
+import sklearn.metrics
+import torch
+import torch.testing
+
+from xib.metrics.pred_class.mean_avg_prec import (
+    average_precision_per_class,
+    mean_average_precision,
+)
+
+
+def test_average_precision_per_class(device):
+    annotations = torch.tensor([
+        [1, 0, 0, 1],
+        [0, 1, 0, 1],
+        [1, 1, 0, 0],
+        [0, 0, 0, 1],
+        [1, 0, 0, 0],
+    ], device=device)
+    scores = torch.tensor([
+        [0.9, 0.1, 0.3, 0.8],
+        [0.2, 0.7, 0.5, 0.4],
+        [0.6, 0.4, 0.2, 0.1],
+        [0.3, 0.8, 0.9, 0.6],
+        [0.1, 0.3, 0.7, 0.5],
+    ], device=device)
+
+    result = average_precision_per_class(annotations, scores)
+
+    # Depending on the version, sklearn returns NaN or 0 for the class without positives
+    with np.errstate(invalid="ignore"):
+        expected = sklearn.metrics.average_precision_score(
+            y_true=annotations.cpu().numpy(), y_score=scores.cpu().numpy(), average=None
+        )
+    expected = torch.tensor(expected, dtype=result.dtype, device=device)
+    has_positives = annotations.sum(dim=0) > 0
+
+    torch.testing.assert_allclose(result[has_positives], expected[has_positives])
+    assert torch.isnan(result[~has_positives]).all()
+
+
+def test_average_precision_per_class_ties(device):
+    # Most scores are tied zeros, like the missing entries of the HICO score matrix
+    annotations = torch.tensor([
+        [1, 0, 1],
+        [0, 1, 1],
+        [1, 0, 0],
+        [0, 1, 1],
+        [1, 1, 0],
+        [0, 0, 1],
+    ], device=device)
+    scores = torch.tensor([
+        [0.0, 0.0, 0.8],
+        [0.0, 0.5, 0.0],
+        [0.7, 0.0, 0.0],
+        [0.0, 0.5, 0.8],
+        [0.0, 0.0, 0.0],
+        [0.7, 0.0, 0.0],
+    ], device=device)
+
+    result = average_precision_per_class(annotations, scores)
+
+    expected = sklearn.metrics.average_precision_score(
+        y_true=annotations.cpu().numpy(), y_score=scores.cpu().numpy(), average=None
+    )
+    expected = torch.tensor(expected, dtype=result.dtype, device=device)
+
+    torch.testing.assert_allclose(result, expected)
+
+
+def test_mean_average_precision_no_positives(device):
+    annotations = torch.zeros(3, 4, device=device)
+    scores = torch.rand(3, 4, device=device)
+
+    assert mean_average_precision(annotations, scores) == 0
@@ -0,0 +1,103 @@
+from types import SimpleNamespace
+
+import torch
+import torch.testing
+
+from xib.metrics.pred_class.recall_at import recall_at, RecallAtBatch, RecallAtEpoch
+
+
+def _reference_recall_at(annotations, scores, sizes):
+    """Recall@x per sample with a full argsort and cumsum, NaN for samples without relevant items"""
+    sorted_labels = torch.argsort(scores, dim=1, descending=True)
+    annotations_of_top_max_s = torch.gather(
+        annotations, index=sorted_labels[:, : max(sizes)], dim=1
+    )
+    cumsum = annotations_of_top_max_s.cumsum(dim=1).float()
+    recall_per_sample = cumsum / annotations.sum(dim=1, keepdims=True)
+    return {s: recall_per_sample[:, s - 1] for s in sizes}
+
+
+def _random_inputs(device, num_samples=16, num_classes=30):
+    generator = torch.Generator().manual_seed(0)
+    annotations = (torch.rand(num_samples, num_classes, generator=generator) < 0.2).long()
+    # Some samples without any relevant item
+    annotations[[2, 7, 11]] = 0
+    scores = torch.rand(num_samples, num_classes, generator=generator)
+    return annotations.to(device), scores.to(device)
+
+
+def _assert_recall_at(annotations, scores, sizes):
+    result = recall_at(annotations, scores, sizes)
+
+    expected = _reference_recall_at(annotations, scores, sizes)
+    for s in sizes:
+        finite = torch.isfinite(expected[s])
+        torch.testing.assert_allclose(result[s], expected[s][finite].mean().item())
+
+
+def test_recall_at_single_size(device):
+    annotations, scores = _random_inputs(device)
+    _assert_recall_at(annotations, scores, (5,))
+
+
+def test_recall_at_multiple_sizes(device):
+    annotations, scores = _random_inputs(device)
+    _assert_recall_at(annotations, scores, (1, 5, 10))
+
+
+def test_recall_at_per_sample(device):
+    annotations, scores = _random_inputs(device)
+
+    for sizes in [(5,), (1, 5, 10)]:
+        result = recall_at(annotations, scores, sizes, aggregate=False)
+
+        expected = _reference_recall_at(annotations, scores, sizes)
+        for s in sizes:
+            assert result[s].shape == (len(annotations),)
+            assert torch.isnan(result[s][[2, 7, 11]]).all()
+            torch.testing.assert_allclose(result[s], expected[s], equal_nan=True)
+
+
+def test_recall_at_epoch(device):
+    annotations, scores = _random_inputs(device)
+    sizes = (1, 5, 10)
+
+    metric = RecallAtEpoch(sizes, device=device)
+    metric.reset()
+    for y_true, y_score in zip(annotations.split(5), scores.split(5)):
+        metric.update((y_true, y_score))
+    result = metric.compute()
+
+    expected = _reference_recall_at(annotations, scores, sizes)
+    for s in sizes:
+        finite = torch.isfinite(expected[s])
+        torch.testing.assert_allclose(result[s], expected[s][finite].mean().item())
+
+
+def test_recall_at_batch_reuses_buffer(device):
+    annotations, scores = _random_inputs(device)
+    sizes = (1, 5, 10)
+    metric = RecallAtBatch(sizes)
+
+    # The batch size shrinks and then grows past the size of the first batch
+    for num_samples in (8, 4, 16):
+        engine = SimpleNamespace(
+            state=SimpleNamespace(
+                output={
+                    "target": annotations[:num_samples],
+                    "output": scores[:num_samples],
+                }
+            )
+        )
+        metric(engine)
+
+        expected = _reference_recall_at(
+            annotations[:num_samples], scores[:num_samples], sizes
+        )
+        for s in sizes:
+            finite = torch.isfinite(expected[s])
+            result = engine.state.output["recalls"][f"pc/recall_at_{s}"]
+            assert result.shape == (num_samples, 1)
+            torch.testing.assert_allclose(
+                result, expected[s][finite].mean().expand(num_samples, 1)
+            )